@@ -29,7 +29,6 @@ from common import (
     CONTENT_TYPE_HTML,
     create_task,
     DOMAINS,
-    DOMAIN_RE,
     error,
     host_url,
     LOCAL_DOMAINS,
@@ -206,6 +205,12 @@ class ActivityPub(User, Protocol):
     @classmethod
     def target_for(cls, obj, shared=False):
         """Returns ``obj``'s or its author's/actor's inbox, if available."""
+        # fast path for stored AP actors, eg followers in Protocol.targets.
+        # avoids converting them to AS1 and back. only actors have inboxes.
+        # https://www.w3.org/TR/activitypub/#actor-objects
+        if obj.as2 and obj.as2.get('inbox') and not obj.our_as1:
+            return cls._inbox_for_actor(obj.as2, shared=shared)
+
         if not obj.as1:
             return None
 
@@ -228,8 +233,19 @@ class ActivityPub(User, Protocol):
 
             logger.info(f'{obj.key} type {obj.type} is not an actor and has no author or actor with inbox')
 
-        actor = cls._convert(obj)
+        return cls._inbox_for_actor(cls._convert(obj), shared=shared)
+
+    @staticmethod
+    def _inbox_for_actor(actor, shared=False):
+        """Returns an AS2 actor's inbox, or its shared inbox if ``shared``.
+
+        Args:
+          actor (dict): AS2 actor
+          shared (bool): whether to prefer ``endpoints.sharedInbox``
 
+        Returns:
+          str: inbox URL, or None
+        """
         if shared:
             shared_inbox = actor.get('endpoints', {}).get('sharedInbox')
             if shared_inbox:
@@ -601,7 +617,8 @@ def signed_request(fn, url, data=None, headers=None, from_user=None,
         from_user = instance_actor()
 
     if data:
-        logger.info(f'Sending AS2 object: {json_dumps(data, indent=2)}')
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f'Sending AS2 object: {json_dumps(data, indent=2)}')
         data = json_dumps(data).encode()
 
     headers = {
@@ -907,7 +924,7 @@ def postprocess_as2_actor(actor, user):
 # source protocol in path; primarily for backcompat
 @app.get(f'/ap/web/<handle_or_id>')
 # special case Web users without /ap/web/ prefix, for backward compatibility
-@app.get(f'/<regex("{DOMAIN_RE}"):handle_or_id>')
+@app.get('/<domain:handle_or_id>')
 @flask_util.headers(CACHE_CONTROL)
 def actor(handle_or_id):
     """Serves a user's AS2 actor from the datastore."""
@@ -984,7 +1001,7 @@ def actor(handle_or_id):
 @app.post(f'/ap/<protocol>/<id>/inbox')
 # special case Web users without /ap/web/ prefix, for backward compatibility
 @app.post('/inbox')
-@app.post(f'/<regex("{DOMAIN_RE}"):id>/inbox')
+@app.post('/<domain:id>/inbox')
 def inbox(protocol=None, id=None):
     """Handles ActivityPub inbox delivery."""
     # parse and validate AS2 activity
@@ -1050,9 +1067,9 @@ def inbox(protocol=None, id=None):
 # protocol in subdomain
 @app.get(f'/ap/<id>/<any(followers,following):collection>')
 # source protocol in path; primarily for backcompat
-@app.get(f'/ap/web/<regex("{DOMAIN_RE}"):id>/<any(followers,following):collection>')
+@app.get('/ap/web/<domain:id>/<any(followers,following):collection>')
 # special case Web users without /ap/web/ prefix, for backward compatibility
-@app.route(f'/<regex("{DOMAIN_RE}"):id>/<any(followers,following):collection>',
+@app.route('/<domain:id>/<any(followers,following):collection>',
            methods=['GET', 'HEAD'])
 @flask_util.headers(CACHE_CONTROL)
 def follower_collection(id, collection):
@@ -1119,9 +1136,9 @@ def follower_collection(id, collection):
 # protocol in subdomain
 @app.get(f'/ap/<id>/outbox')
 # source protocol in path; primarily for backcompat
-@app.get(f'/ap/web/<regex("{DOMAIN_RE}"):id>/outbox')
+@app.get('/ap/web/<domain:id>/outbox')
 # special case Web users without /ap/web/ prefix, for backward compatibility
-@app.route(f'/<regex("{DOMAIN_RE}"):id>/outbox', methods=['GET', 'HEAD'])
+@app.route('/<domain:id>/outbox', methods=['GET', 'HEAD'])
 @flask_util.headers(CACHE_CONTROL)
 def outbox(id):
     """Serves a user's AP outbox.
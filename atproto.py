@@ -5,7 +5,6 @@ https://atproto.com/
 import itertools
 import logging
 import os
-import re
 
 from arroba import did
 from arroba.datastore_storage import AtpRemoteBlob, AtpRepo, DatastoreStorage
@@ -30,7 +29,8 @@ from oauth_dropins.webutil.util import json_dumps, json_loads
 import common
 from common import (
     add,
-    DOMAIN_BLOCKLIST,
+    DOMAIN_BLOCKLIST_SET,
+    domain_or_parent_in_set,
     DOMAIN_RE,
     DOMAINS,
     error,
@@ -173,7 +173,7 @@ class ATProto(User, Protocol):
             assert id.removeprefix('did:plc:')
         elif id.startswith('did:web:'):
             domain = id.removeprefix('did:web:')
-            assert (re.match(common.DOMAIN_RE, domain)
+            assert (common.DOMAIN_PATTERN.match(domain)
                     and not Protocol.is_blocklisted(domain)), domain
         else:
             assert False, f'{id} is not valid did:plc or did:web'
@@ -298,7 +298,8 @@ class ATProto(User, Protocol):
     def is_blocklisted(url, allow_internal=False):
         # don't block common.DOMAINS since we want ourselves, ie our own PDS, to
         # be a valid domain to send to
-        return util.domain_or_parent_in(util.domain_from_link(url), DOMAIN_BLOCKLIST)
+        return domain_or_parent_in_set(util.domain_from_link(url),
+                                       DOMAIN_BLOCKLIST_SET)
 
     @classmethod
     @ndb.transactional()
@@ -1,6 +1,9 @@
 """Misc common utilities."""
 import base64
+from concurrent.futures import Future, ThreadPoolExecutor
+import copy
 from datetime import timedelta
+import json
 import logging
 from pathlib import Path
 import re
@@ -9,7 +12,6 @@ import urllib.parse
 from urllib.parse import urljoin, urlparse
 
 import cachetools
-from Crypto.Util import number
 from flask import abort, g, make_response, request
 from google.cloud.error_reporting.util import build_flask_context
 from google.cloud.ndb.global_cache import _InProcessGlobalCache, MemcacheCache
@@ -20,6 +22,7 @@ from oauth_dropins.webutil import appengine_info
 from oauth_dropins.webutil.appengine_info import DEBUG
 from oauth_dropins.webutil import flask_util
 import pymemcache.client.base
+from werkzeug.routing import BaseConverter
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +32,9 @@ logger = logging.getLogger(__name__)
 #
 # TODO: preprocess with domain2idna, then narrow this to just [a-z0-9-]
 DOMAIN_RE = r'^([^/:;@?!\']+\.)+[^/:@_?!\']+$'
+# use this compiled version when matching in code, and the <domain:...> URL
+# converter (DomainConverter) in Flask route patterns.
+DOMAIN_PATTERN = re.compile(DOMAIN_RE)
 TLD_BLOCKLIST = ('7z', 'asp', 'aspx', 'gif', 'html', 'ico', 'jpg', 'jpeg', 'js',
                  'json', 'php', 'png', 'rar', 'txt', 'yaml', 'yml', 'zip')
 
@@ -59,6 +65,13 @@ LOCAL_DOMAINS = (
   'my.dev.com:8080',
 )
 DOMAINS = (PRIMARY_DOMAIN,) + PROTOCOL_DOMAINS + OTHER_DOMAINS + LOCAL_DOMAINS
+# for membership checks on hot paths
+_DOMAINS_SET = frozenset(DOMAINS)
+_LOCAL_DOMAINS_SET = frozenset(LOCAL_DOMAINS)
+# URL prefixes that are definitely on one of our domains. Must end in / so that
+# eg https://fed.brid.gy.example.com doesn't match.
+_DOMAIN_URL_PREFIXES = tuple(f'{scheme}://{domain}/' for domain in DOMAINS
+                             for scheme in ('https', 'http'))
 # TODO: unify with Bridgy's
 DOMAIN_BLOCKLIST = (
     'bsky.social',
@@ -68,13 +81,18 @@ DOMAIN_BLOCKLIST = (
     'twitter.com',
     'x.com',
 )
+DOMAIN_BLOCKLIST_SET = frozenset(DOMAIN_BLOCKLIST)
+DOMAIN_BLOCKLIST_AND_DOMAINS_SET = DOMAIN_BLOCKLIST_SET | _DOMAINS_SET
 
 SMTP_HOST = 'smtp.gmail.com'
 SMTP_PORT = 587
 
 # populated in models.reset_protocol_properties
 SUBDOMAIN_BASE_URL_RE = None
-ID_FIELDS = ['id', 'object', 'actor', 'author', 'inReplyTo', 'url']
+ID_FIELDS = frozenset(('id', 'object', 'actor', 'author', 'inReplyTo', 'url'))
+# URL paths of protocol bot user ids, eg https://bsky.brid.gy/ or
+# https://fed.brid.gy/bsky.brid.gy . used in unwrap.
+BOT_USER_ID_PATHS = frozenset(DOMAINS + ('',))
 
 CACHE_CONTROL = {'Cache-Control': 'public, max-age=3600'}  # 1 hour
 
@@ -85,6 +103,10 @@ util.set_user_agent(USER_AGENT)
 TASKS_LOCATION = 'us-central1'
 RUN_TASKS_INLINE = False  # overridden by unit tests
 
+# used by create_tasks to make Cloud Tasks API calls in parallel
+_create_tasks_executor = ThreadPoolExecutor(max_workers=16,
+                                            thread_name_prefix='create_tasks')
+
 # for Protocol.REQUIRES_OLD_ACCOUNT, how old is old enough
 OLD_ACCOUNT_AGE = timedelta(days=14)
 
@@ -101,7 +123,7 @@ def base64_to_long(x):
     Originally from ``django_salmon.magicsigs``. Used in :meth:`User.public_pem`
     and :meth:`User.private_pem`.
     """
-    return number.bytes_to_long(base64.urlsafe_b64decode(x))
+    return int.from_bytes(base64.urlsafe_b64decode(x), 'big')
 
 
 def long_to_base64(x):
@@ -109,14 +131,58 @@ def long_to_base64(x):
 
     Originally from ``django_salmon.magicsigs``. Used in :meth:`User.get_or_create`.
     """
-    return base64.urlsafe_b64encode(number.long_to_bytes(x))
+    num_bytes = max(1, (x.bit_length() + 7) // 8)
+    return base64.urlsafe_b64encode(x.to_bytes(num_bytes, 'big'))
+
+
+def domain_or_parent_in_set(domain, domains):
+    """Returns True if a domain or any of its parent domains is in a set.
+
+    Like :func:`oauth_dropins.webutil.util.domain_or_parent_in`, but does one
+    set lookup per label in ``domain`` instead of scanning all of ``domains``.
+
+    Args:
+      domain (str)
+      domains (set or frozenset of str)
+
+    Returns:
+      bool:
+    """
+    if not domain or not domains:
+        return False
+
+    while True:
+        if domain in domains:
+            return True
+        _, dot, domain = domain.partition('.')
+        if not dot:
+            return False
+
+
+class DomainConverter(BaseConverter):
+    """URL converter for Flask routes that matches :const:`DOMAIN_RE`.
+
+    Registered as ``domain`` in :mod:`flask_app`, eg ``/<domain:id>/inbox``.
+    """
+    # werkzeug anchors converter regexps itself
+    regex = DOMAIN_RE.removeprefix('^').removesuffix('$')
+
+
+@cachetools.cached(cachetools.LRUCache(100), lock=threading.Lock())
+def _host_uses_primary_domain(host):
+    """Returns True if :func:`host_url` should use ``PRIMARY_DOMAIN`` for a host.
+
+    Args:
+      host (str): request hostname, optionally with port
+    """
+    return bool(util.domain_or_parent_in(host, OTHER_DOMAINS)
+                # when running locally against prod datastore
+                or (not DEBUG and host in _LOCAL_DOMAINS_SET))
 
 
 def host_url(path_query=None):
     base = request.host_url
-    if (util.domain_or_parent_in(request.host, OTHER_DOMAINS)
-            # when running locally against prod datastore
-            or (not DEBUG and request.host in LOCAL_DOMAINS)):
+    if _host_uses_primary_domain(request.host):
         base = f'https://{PRIMARY_DOMAIN}'
 
     assert base
@@ -130,6 +196,10 @@ def error(err, status=400, exc_info=None, **kwargs):
     abort(status, response=make_response({'error': msg}, status), **kwargs)
 
 
+# Mastodon user URLs, eg https://mastodon.social/@foo, https://mastodon.social/users/foo
+MASTODON_USER_URL_RE = re.compile(r'https?://([^/]+)/(@|users/)([^/]+)$')
+
+
 def pretty_link(url, text=None, user=None, **kwargs):
     """Wrapper around :func:`oauth_dropins.webutil.util.pretty_link` that converts Mastodon user URLs to @-@ handles.
 
@@ -147,9 +217,10 @@ def pretty_link(url, text=None, user=None, **kwargs):
         return user.user_link()
 
     if text is None:
-        match = re.match(r'https?://([^/]+)/(@|users/)([^/]+)$', url)
+        match = MASTODON_USER_URL_RE.match(url)
         if match:
-            text = match.expand(r'@\3@\1')
+            host, _, username = match.groups()
+            text = f'@{username}@{host}'
 
     return util.pretty_link(url, text=text, **kwargs)
 
@@ -175,7 +246,8 @@ def redirect_wrap(url):
     Returns:
       str: redirect url
     """
-    if not url or util.domain_from_link(url) in DOMAINS:
+    if (not url or url.startswith(_DOMAIN_URL_PREFIXES)
+            or util.domain_from_link(url) in _DOMAINS_SET):
         return url
 
     return host_url('/r/') + url
@@ -197,6 +269,26 @@ def subdomain_wrap(proto, path=None):
     return urljoin(f'https://{subdomain}{SUPERDOMAIN}/', path)
 
 
+def json_copy(val):
+    """Returns a deep copy of a JSON-compatible value, eg an AS1 object.
+
+    Round trips through :mod:`json`, which is much faster than
+    :func:`copy.deepcopy` for plain dicts and lists. Falls back to
+    :func:`copy.deepcopy` if ``val`` isn't JSON serializable, eg if it contains
+    datetimes, which are preserved as is.
+
+    Args:
+      val: dict, list, str, etc
+
+    Returns:
+      copy of ``val``
+    """
+    try:
+        return json.loads(json.dumps(val))
+    except (TypeError, ValueError):
+        return copy.deepcopy(val)
+
+
 def unwrap(val, field=None):
     """Removes our subdomain/redirect wrapping from a URL, if it's there.
 
@@ -205,6 +297,10 @@ def unwrap(val, field=None):
 
     Strings that aren't wrapped URLs are left unchanged.
 
+    ``val`` itself is never modified. If nothing in it is wrapped, it's returned
+    as is. Otherwise, only the dicts and lists that contain wrapped URLs are
+    copied; the result shares everything else with ``val``.
+
     Args:
       val (str or dict or list)
       field (str): optional field name for this value
@@ -216,20 +312,39 @@ def unwrap(val, field=None):
     if isinstance(val, dict):
         # TODO: clean up. https://github.com/snarfed/bridgy-fed/issues/967
         id = val.get('id')
-        if (id and urlparse(id).path.strip('/') in DOMAINS + ('',)
-            and util.domain_from_link(id) in DOMAINS):
+        if (id and urlparse(id).path.strip('/') in BOT_USER_ID_PATHS
+            and util.domain_from_link(id) in _DOMAINS_SET):
             # protocol bot user, don't touch its URLs
-            return {**val, 'id': unwrap(id)}
+            unwrapped_id = unwrap(id)
+            return val if unwrapped_id is id else {**val, 'id': unwrapped_id}
+
+        unwrapped = None
+        for f, v in val.items():
+            new = unwrap(v, field=f)
+            if new is not v:
+                if unwrapped is None:
+                    unwrapped = dict(val)
+                unwrapped[f] = new
 
-        return {f: unwrap(v, field=f) for f, v in val.items()}
+        return val if unwrapped is None else unwrapped
 
     elif isinstance(val, list):
-        return [unwrap(v) for v in val]
+        unwrapped = None
+        for i, v in enumerate(val):
+            new = unwrap(v)
+            if new is not v:
+                if unwrapped is None:
+                    unwrapped = list(val)
+                unwrapped[i] = new
+
+        return val if unwrapped is None else unwrapped
 
     elif isinstance(val, str):
-        if match := SUBDOMAIN_BASE_URL_RE.match(val):
+        # cheap check first, most strings in AS1 objects aren't URLs
+        if (val.startswith(('http://', 'https://'))
+                and (match := SUBDOMAIN_BASE_URL_RE.match(val))):
             unwrapped = match.group('path')
-            if field in ID_FIELDS and re.fullmatch(DOMAIN_RE, unwrapped):
+            if field in ID_FIELDS and DOMAIN_PATTERN.fullmatch(unwrapped):
                 return f'https://{unwrapped}/'
             return unwrapped
 
@@ -259,12 +374,50 @@ def webmention_endpoint_cache_key(url):
     return key
 
 
-@cachetools.cached(cachetools.TTLCache(50000, 60 * 60 * 2),  # 2h expiration
-                   key=webmention_endpoint_cache_key,
-                   lock=threading.Lock())
+_webmention_endpoints = cachetools.TTLCache(50000, 60 * 60 * 2)  # 2h expiration
+_webmention_endpoints_lock = threading.Lock()
+# maps cache key to Future for the discovery currently in flight for that key
+_webmention_discover_inflight = {}
+
+
 def webmention_discover(url, **kwargs):
-    """Thin caching wrapper around :func:`oauth_dropins.webutil.webmention.discover`."""
-    return webmention.discover(url, **kwargs)
+    """Thin caching wrapper around :func:`oauth_dropins.webutil.webmention.discover`.
+
+    Concurrent calls for the same uncached key wait for the first call's
+    discovery and then return its result or re-raise its exception, instead of
+    all fetching it themselves.
+    """
+    key = webmention_endpoint_cache_key(url)
+
+    with _webmention_endpoints_lock:
+        endpoint = _webmention_endpoints.get(key)
+        if endpoint is not None:
+            return endpoint
+        future = _webmention_discover_inflight.get(key)
+        if not future:
+            future = _webmention_discover_inflight[key] = Future()
+            owner = True
+        else:
+            owner = False
+
+    if not owner:
+        return future.result()
+
+    try:
+        endpoint = webmention.discover(url, **kwargs)
+    except BaseException as e:
+        with _webmention_endpoints_lock:
+            _webmention_discover_inflight.pop(key, None)
+        future.set_exception(e)
+        raise
+
+    with _webmention_endpoints_lock:
+        _webmention_endpoints[key] = endpoint
+        _webmention_discover_inflight.pop(key, None)
+    future.set_result(endpoint)
+    return endpoint
+
+webmention_discover.cache = _webmention_endpoints
 
 
 def add(seq, val):
@@ -285,6 +438,17 @@ def remove(seq, val):
         seq.remove(val)
 
 
+@cachetools.cached(cachetools.LRUCache(100), lock=threading.Lock())
+def _queue_path(app_id, queue):
+    """Returns the fully qualified Cloud Tasks path for a queue.
+
+    Args:
+      app_id (str)
+      queue (str): queue name
+    """
+    return tasks_client.queue_path(app_id, TASKS_LOCATION, queue)
+
+
 def create_task(queue, delay=None, **params):
     """Adds a Cloud Tasks task.
 
@@ -328,13 +492,35 @@ def create_task(queue, delay=None, **params):
         eta_seconds = int(util.to_utc_timestamp(util.now()) + delay.total_seconds())
         task['schedule_time'] = Timestamp(seconds=eta_seconds)
 
-    parent = tasks_client.queue_path(appengine_info.APP_ID, TASKS_LOCATION, queue)
+    parent = _queue_path(appengine_info.APP_ID, queue)
     task = tasks_client.create_task(parent=parent, task=task)
     msg = f'Added {queue} task {task.name} : {params}'
     logger.info(msg)
     return msg, 202
 
 
+def create_tasks(queue, tasks, delay=None):
+    """Adds multiple Cloud Tasks tasks to the same queue, in parallel.
+
+    If running in a local server, runs the task handlers inline, in order, like
+    :func:`create_task`.
+
+    Args:
+      queue (str): queue name
+      tasks (sequence of dict): params for each task, passed to
+        :func:`create_task`
+      delay (:class:`datetime.timedelta`): optional, used as task ETA (from now)
+
+    Returns:
+      list: responses from :func:`create_task`, in the same order as ``tasks``
+    """
+    if RUN_TASKS_INLINE or appengine_info.LOCAL_SERVER or len(tasks) <= 1:
+        return [create_task(queue, delay=delay, **params) for params in tasks]
+
+    return list(_create_tasks_executor.map(
+        lambda params: create_task(queue, delay=delay, **params), tasks))
+
+
 def email_me(msg):
     assert False  # not working, SMTP woes :(
     if not DEBUG:
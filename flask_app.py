@@ -16,7 +16,7 @@ from oauth_dropins.webutil import (
     flask_util,
 )
 
-from common import global_cache, global_cache_timeout_policy
+from common import DomainConverter, global_cache, global_cache_timeout_policy
 
 logger = logging.getLogger(__name__)
 # logging.getLogger('lexrpc').setLevel(logging.INFO)
@@ -29,6 +29,7 @@ app.template_folder = './templates'
 app.json.compact = False
 app.config.from_pyfile(app_dir / 'config.py')
 app.url_map.converters['regex'] = flask_util.RegexConverter
+app.url_map.converters['domain'] = DomainConverter
 app.after_request(flask_util.default_modern_headers)
 app.register_error_handler(Exception, flask_util.handle_exception)
 if (appengine_info.LOCAL_SERVER
@@ -40,10 +40,16 @@ _NON_WEB_SUBDOMAIN_SITES = None
 # https://github.com/snarfed/bridgy-fed/issues/982
 # https://github.com/swicg/activitypub-webfinger/issues/9
 ATPROTO_DASH_CHARS = ('_', '~', ':')
+# for translate_handle. also converts the @ between user and domain to .
+_ATPROTO_HANDLE_TRANS = str.maketrans({'@': '.', **{c: '-' for c in ATPROTO_DASH_CHARS}})
+
+# handles that we don't add a protocol subdomain suffix to in translate_handle
+_BOT_HANDLES = frozenset((PRIMARY_DOMAIN,) + PROTOCOL_DOMAINS)
 
 # can't use translate_user_id because Web.owns_id checks valid_domain, which
 # doesn't allow our protocol subdomains
-BOT_ACTOR_AP_IDS = tuple(f'https://{domain}/{domain}' for domain in PROTOCOL_DOMAINS)
+BOT_ACTOR_AP_IDS = frozenset(f'https://{domain}/{domain}'
+                             for domain in PROTOCOL_DOMAINS)
 
 
 def web_ap_base_domain(user_domain):
@@ -95,10 +101,11 @@ def translate_user_id(*, id, from_, to):
     assert from_.owns_id(id) is not False or from_.LABEL == 'ui', \
         (id, from_.LABEL, to.LABEL)
 
-    parsed = urlparse(id)
-    if from_.LABEL == 'web' and parsed.path.strip('/') == '':
-        # home page; replace with domain
-        id = parsed.netloc
+    if from_.LABEL == 'web':
+        parsed = urlparse(id)
+        if parsed.path.strip('/') == '':
+            # home page; replace with domain
+            id = parsed.netloc
 
     # bsky.app profile URL to DID
     if to.LABEL == 'atproto':
@@ -239,21 +246,15 @@ def translate_handle(*, handle, from_, to, enhanced):
         return handle
 
     output = None
+    keep_domain = enhanced or handle in _BOT_HANDLES
     match from_.LABEL, to.LABEL:
         case _, 'activitypub':
-            domain = f'{from_.ABBREV}{SUPERDOMAIN}'
-            if enhanced or handle == PRIMARY_DOMAIN or handle in PROTOCOL_DOMAINS:
-                domain = handle
+            domain = handle if keep_domain else f'{from_.ABBREV}{SUPERDOMAIN}'
             output = f'@{handle}@{domain}'
 
         case _, 'atproto':
-            output = handle.lstrip('@').replace('@', '.')
-            for from_char in ATPROTO_DASH_CHARS:
-                output = output.replace(from_char, '-')
-
-            if enhanced or handle == PRIMARY_DOMAIN or handle in PROTOCOL_DOMAINS:
-                pass
-            else:
+            output = handle.lstrip('@').translate(_ATPROTO_HANDLE_TRANS)
+            if not keep_domain:
                 output = f'{output}.{from_.ABBREV}{SUPERDOMAIN}'
 
         case 'activitypub', 'web':
@@ -27,7 +27,7 @@ import common
 from common import (
     add,
     base64_to_long,
-    DOMAIN_RE,
+    DOMAIN_PATTERN,
     long_to_base64,
     OLD_ACCOUNT_AGE,
     remove,
@@ -79,6 +79,15 @@ OBJECT_EXPIRE_AGE = timedelta(days=90)
 
 OPT_OUT_TAGS = frozenset(('#nobot', '#nobridge'))
 
+# (User subclass, key id) tuples that pages.load_user or redirect.redir recently
+# looked up with get_by_id and didn't find. we get lots of repeated requests for
+# non-existent users. User._post_put_hook removes users from here when they're
+# written, but only in this process. users created or re-enabled via another
+# instance can 404 here until their entry expires, which we accept in exchange
+# for skipping the datastore lookups.
+users_not_found = cachetools.TTLCache(10000, 60)  # 1m expiration
+users_not_found_lock = Lock()
+
 logger = logging.getLogger(__name__)
 
 
@@ -120,6 +129,20 @@ class Target(ndb.Model):
         return hash((self.protocol, self.uri))
 
 
+@cachetools.cached({}, lock=Lock())
+def sorted_protocols():
+    """Returns all populated protocol classes in ``PROTOCOLS``, sorted by label.
+
+    Memoized. :class:`ProtocolUserMeta` clears the memo whenever it registers a
+    new class.
+
+    Returns:
+      tuple of :class:`Protocol` subclasses: deduped, sorted deterministically
+    """
+    return tuple(sorted(set(p for p in PROTOCOLS.values() if p),
+                        key=lambda p: p.LABEL))
+
+
 class ProtocolUserMeta(type(ndb.Model)):
     """:class:`User` metaclass. Registers all subclasses in the ``PROTOCOLS`` global."""
     def __new__(meta, name, bases, class_dict):
@@ -129,6 +152,7 @@ class ProtocolUserMeta(type(ndb.Model)):
             for label in (cls.LABEL, cls.ABBREV) + cls.OTHER_LABELS:
                 if label:
                     PROTOCOLS[label] = cls
+            sorted_protocols.cache.clear()
 
         return cls
 
@@ -215,6 +239,8 @@ class User(StringIdModel, metaclass=ProtocolUserMeta):
 
     def _post_put_hook(self, future):
         logger.info(f'Wrote {self.key}')
+        with users_not_found_lock:
+            users_not_found.pop((self.__class__, self.key.id()), None)
 
     @classmethod
     def get_by_id(cls, id, allow_opt_out=False):
@@ -683,13 +709,14 @@ class User(StringIdModel, metaclass=ProtocolUserMeta):
         Returns:
           (int, int) tuple: (number of followers, number following)
         """
+        # run both queries in parallel
         num_followers = Follower.query(Follower.to == self.key,
                                        Follower.status == 'active')\
-                                .count()
+                                .count_async()
         num_following = Follower.query(Follower.from_ == self.key,
                                        Follower.status == 'active')\
-                                .count()
-        return num_followers, num_following
+                                .count_async()
+        return num_followers.get_result(), num_following.get_result()
 
 
 class Object(StringIdModel):
@@ -771,7 +798,7 @@ class Object(StringIdModel):
         def use_urls_as_ids(obj):
             """If id field is missing or not a URL, use the url field."""
             id = obj.get('id')
-            if not id or not (util.is_web(id) or re.match(DOMAIN_RE, id)):
+            if not id or not (util.is_web(id) or DOMAIN_PATTERN.match(id)):
                 if url := util.get_url(obj):
                     obj['id'] = url
 
@@ -1099,15 +1126,20 @@ class Object(StringIdModel):
             return
 
         # extract ids, strip Bridgy Fed subdomain URLs
-        outer_obj = unwrap(self.as1)
-        if outer_obj != self.as1:
+        orig_as1 = self.as1
+        outer_obj = unwrap(orig_as1)
+        if outer_obj is not orig_as1:
             self.our_as1 = util.trim_nulls(outer_obj)
 
         self_proto = PROTOCOLS.get(self.source_protocol)
         if not self_proto:
             return
 
-        inner_obj = outer_obj['object'] = as1.get_object(outer_obj)
+        # unwrap shares unchanged values with its input, so below we only copy
+        # the dicts we modify: these two, and any mention tags or id objects
+        # that we rewrite
+        outer_obj = dict(outer_obj)
+        inner_obj = outer_obj['object'] = dict(as1.get_object(outer_obj))
         fields = ['actor', 'author', 'inReplyTo']
 
         # collect relevant ids
@@ -1127,9 +1159,9 @@ class Object(StringIdModel):
         # batch lookup matching users
         origs = {}  # maps str copy URI to str original URI
         for obj in get_originals(ids):
-            for copy in obj.copies:
-                if copy.protocol in (self_proto.LABEL, self_proto.ABBREV):
-                    origs[copy.uri] = obj.key.id()
+            for copy_ in obj.copies:
+                if copy_.protocol in (self_proto.LABEL, self_proto.ABBREV):
+                    origs[copy_.uri] = obj.key.id()
 
         logger.debug(f'Resolving {self_proto.LABEL} ids; originals: {origs}')
         replaced = False
@@ -1143,16 +1175,20 @@ class Object(StringIdModel):
             nonlocal replaced
             replaced = True
             if isinstance(val, dict) and val.keys() > {'id'}:
-                val['id'] = orig
-                return val
+                return {**val, 'id': orig}
             else:
                 return orig
 
+        def replace_mention(tag):
+            if isinstance(tag, dict) and tag.get('objectType') == 'mention':
+                return {**tag, 'url': replace(tag.get('url'))}
+            return tag
+
         # actually replace ids
         for obj in outer_obj, inner_obj:
-            for tag in as1.get_objects(obj, 'tags'):
-                if tag.get('objectType') == 'mention':
-                    tag['url'] = replace(tag.get('url'))
+            if tags := obj.get('tags'):
+                obj['tags'] = ([replace_mention(tag) for tag in tags]
+                               if isinstance(tags, list) else replace_mention(tags))
             for field in fields:
                 obj[field] = [replace(val) for val in util.get_list(obj, field)]
                 if len(obj[field]) == 1:
@@ -1512,12 +1548,13 @@ def fetch_page(query, model_class, by=None):
     else:
         query = query.order(-by)
 
-    query_iter = query.iter()
-    results = sorted(itertools.islice(query_iter, 0, PAGE_SIZE),
-                     key=lambda r: r.updated, reverse=True)
+    # fetch just one page in one batch. (sort isn't redundant: after queries
+    # are ascending, and we always show newest updated first.)
+    results, _, more = query.fetch_page(PAGE_SIZE)
+    results.sort(key=lambda r: r.updated, reverse=True)
 
     # calculate new paging param(s)
-    has_next = results and query_iter.probably_has_next()
+    has_next = results and more
     new_after = (
         before if before
         else results[0].updated if has_next and after
@@ -24,9 +24,10 @@ import werkzeug.exceptions
 
 from activitypub import ActivityPub, instance_actor
 import common
-from common import CACHE_CONTROL, DOMAIN_RE
+from common import CACHE_CONTROL
 from flask_app import app
 import ids
+import models
 from models import fetch_objects, fetch_page, Follower, Object, PAGE_SIZE, PROTOCOLS
 from protocol import Protocol
 
@@ -69,7 +70,15 @@ def load_user(protocol, id):
 
     if cls.ABBREV == 'ap' and not id.startswith('@'):
         id = '@' + id
-    user = cls.get_by_id(id)
+
+    # only cache misses by key id, not handle, since User._post_put_hook can
+    # only invalidate by key id
+    with models.users_not_found_lock:
+        id_not_found = (cls, id) in models.users_not_found
+    user = None if id_not_found else cls.get_by_id(id)
+    if not user and not id_not_found:
+        with models.users_not_found_lock:
+            models.users_not_found[(cls, id)] = True
 
     if cls.ABBREV != 'web':
         if not user:
@@ -110,9 +119,9 @@ def docs():
     return render_template('docs.html')
 
 
-@app.get(f'/user/<regex("{DOMAIN_RE}"):domain>')
-@app.get(f'/user/<regex("{DOMAIN_RE}"):domain>/feed')
-@app.get(f'/user/<regex("{DOMAIN_RE}"):domain>/<any(followers,following):collection>')
+@app.get('/user/<domain:domain>')
+@app.get('/user/<domain:domain>/feed')
+@app.get('/user/<domain:domain>/<any(followers,following):collection>')
 @canonicalize_request_domain(common.PROTOCOL_DOMAINS, common.PRIMARY_DOMAIN)
 def web_user_redirects(**kwargs):
     path = request.url.removeprefix(request.root_url).removeprefix('user/')
@@ -129,7 +138,17 @@ def profile(protocol, id):
     query = Object.query(Object.users == user.key)
     objects, before, after = fetch_objects(query, by=Object.updated, user=user)
     num_followers, num_following = user.count_followers()
-    return render_template('profile.html', **TEMPLATE_VARS, **locals())
+    return render_template(
+        'profile.html',
+        **TEMPLATE_VARS,
+        id=id,
+        user=user,
+        objects=objects,
+        before=before,
+        after=after,
+        num_followers=num_followers,
+        num_following=num_following,
+    )
 
 
 @app.get(f'/<any({",".join(PROTOCOLS)}):protocol>/<id>/home')
@@ -141,7 +160,8 @@ def home(protocol, id):
 
     # this calls Object.actor_link serially for each object, which loads the
     # actor from the datastore if necessary. TODO: parallelize those fetches
-    return render_template('home.html', **TEMPLATE_VARS, **locals())
+    return render_template('home.html', **TEMPLATE_VARS, id=id, user=user,
+                           objects=objects, before=before, after=after)
 
 
 @app.get(f'/<any({",".join(PROTOCOLS)}):protocol>/<id>/notifications')
@@ -159,7 +179,8 @@ def notifications(protocol, id):
                           quiet=request.args.get('quiet'))
 
     # notifications tab UI page
-    return render_template('notifications.html', **TEMPLATE_VARS, **locals())
+    return render_template('notifications.html', **TEMPLATE_VARS, id=id,
+                           user=user, objects=objects, before=before, after=after)
 
 
 @app.post(f'/<any({",".join(PROTOCOLS)}):protocol>/<id>/update-profile')
@@ -196,7 +217,13 @@ def followers_or_following(protocol, id, collection):
         address=request.args.get('address'),
         follow_url=request.values.get('url'),
         **TEMPLATE_VARS,
-        **locals(),
+        id=id,
+        user=user,
+        followers=followers,
+        before=before,
+        after=after,
+        num_followers=num_followers,
+        num_following=num_following,
     )
 
 
@@ -282,7 +309,8 @@ def serve_feed(*, objects, format, user, title, as_snippets=False, quiet=False):
     # syntax. maybe a fediverse kwarg down through the call chain?
     if format == 'html':
         entries = [microformats2.object_to_html(a) for a in activities]
-        return render_template('feed.html', **TEMPLATE_VARS, **locals())
+        return render_template('feed.html', **TEMPLATE_VARS, title=title,
+                               entries=entries)
     elif format == 'atom':
         body = atom.activities_to_atom(activities, actor=actor, title=title,
                                        request_url=request.url)
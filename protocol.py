@@ -1,10 +1,11 @@
 """Base protocol class and common code."""
-import copy
 from datetime import timedelta
+import functools
 import logging
 import re
+import sys
 from threading import Lock
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin
 
 from cachetools import cached, LRUCache
 from flask import request
@@ -23,10 +24,13 @@ import werkzeug.exceptions
 import common
 from common import (
     add,
-    DOMAIN_BLOCKLIST,
+    DOMAIN_BLOCKLIST_AND_DOMAINS_SET,
+    DOMAIN_BLOCKLIST_SET,
+    domain_or_parent_in_set,
     DOMAIN_RE,
     DOMAINS,
     error,
+    json_copy,
     PRIMARY_DOMAIN,
     PROTOCOL_DOMAINS,
     report_error,
@@ -38,7 +42,15 @@ from ids import (
     translate_object_id,
     translate_user_id,
 )
-from models import Follower, get_originals, Object, PROTOCOLS, Target, User
+from models import (
+    Follower,
+    get_originals,
+    Object,
+    PROTOCOLS,
+    sorted_protocols,
+    Target,
+    User,
+)
 
 SUPPORTED_TYPES = (
     'accept',
@@ -65,6 +77,14 @@ OBJECT_REFRESH_AGE = timedelta(days=30)
 # them other than their profile
 LIMITED_DOMAINS = util.load_file_lines('limited_domains')
 
+# end of the "[bridged ... by Bridgy Fed]" disclaimer that Protocol.convert
+# adds to actor summaries
+DISCLAIMER_HTML_SUFFIX = f'by <a href="https://{PRIMARY_DOMAIN}/">Bridgy Fed</a>]'
+
+# path part of an http(s) URL, ie without query or fragment. used in
+# _is_homepage
+URL_PATH_RE = re.compile(r'^https?://[^/?#]*(?P<path>[^?#]*)', re.IGNORECASE)
+
 # activity ids that we've already handled and can now ignore.
 # used in Protocol.receive
 seen_ids = LRUCache(100000)
@@ -73,11 +93,70 @@ seen_ids_lock = Lock()
 logger = logging.getLogger(__name__)
 
 
+def _is_homepage(url):
+    """Returns True if an http(s) URL has an empty path, eg ``https://foo/``.
+
+    Args:
+      url (str)
+    """
+    match = URL_PATH_RE.match(url)
+    return not match or match['path'].strip('/') == ''
+
+
+@cached(LRUCache(10000), lock=Lock())
+def _bridgy_subdomain_label(domain_or_url):
+    """Returns the ``brid.gy`` subdomain label for a domain or URL, or None.
+
+    Returns ``fed`` for :const:`common.PRIMARY_DOMAIN` and
+    :const:`common.LOCAL_DOMAINS`. Memoized. Only returns strings, not
+    protocol classes, so that :meth:`Protocol.for_bridgy_subdomain` always
+    sees the current ``PROTOCOLS``.
+
+    Args:
+      domain_or_url (str)
+    """
+    domain = (util.domain_from_link(domain_or_url, minimize=False)
+              if util.is_web(domain_or_url)
+              else domain_or_url)
+
+    if domain == common.PRIMARY_DOMAIN or domain in common.LOCAL_DOMAINS:
+        return 'fed'
+    elif domain and domain.endswith(common.SUPERDOMAIN):
+        return domain.removesuffix(common.SUPERDOMAIN)
+
+
+def _has_bridged_disclaimer(summary):
+    """Returns True if an HTML summary already has a "...by Bridgy Fed]" label.
+
+    Looks for the raw HTML of our own disclaimer first. Only parses the HTML if
+    that's missing but the raw string still contains ``Bridgy``, eg a
+    disclaimer with different markup.
+
+    Args:
+      summary (str): HTML; may be None
+    """
+    if not summary or 'Bridgy' not in summary:
+        return False
+    elif DISCLAIMER_HTML_SUFFIX in summary:
+        return True
+
+    return 'Bridgy Fed]' in html_to_text(summary)
+
+
+@cached(LRUCache(10000), lock=Lock())
+def _is_blocklisted(url, allow_internal):
+    """Implements :meth:`Protocol.is_blocklisted`. Memoized per URL."""
+    blocklist = (DOMAIN_BLOCKLIST_SET if allow_internal
+                 else DOMAIN_BLOCKLIST_AND_DOMAINS_SET)
+    return domain_or_parent_in_set(util.domain_from_link(url), blocklist)
+
+
 class Protocol:
     """Base protocol class. Not to be instantiated; classmethods only.
 
     Attributes:
-      LABEL (str): human-readable lower case name
+      LABEL (str): human-readable lower case name. Defaults to the lower case
+        class name.
       OTHER_LABELS (list of str): label aliases
       ABBREV (str): lower case abbreviation, used in URL paths
       PHRASE (str): human-readable name or phrase. Used in phrases like
@@ -103,6 +182,7 @@ class Protocol:
       DEFAULT_ENABLED_PROTOCOLS (list of str): labels of other protocols that
         are automatically enabled for this protocol to bridge into
     """
+    LABEL = 'protocol'
     ABBREV = None
     PHRASE = None
     OTHER_LABELS = ()
@@ -115,13 +195,20 @@ class Protocol:
     REQUIRES_OLD_ACCOUNT = False
     DEFAULT_ENABLED_PROTOCOLS = ()
 
+    # whether LABEL is the default, ie derived from the class name, as opposed
+    # to set explicitly. subclasses of classes with explicit labels inherit them.
+    _default_label = True
+
     def __init__(self):
         assert False
 
-    @classmethod
-    @property
-    def LABEL(cls):
-        return cls.__name__.lower()
+    def __init_subclass__(cls, **kwargs):
+        """Sets :attr:`LABEL` once, at class creation time, if necessary."""
+        super().__init_subclass__(**kwargs)
+        if 'LABEL' in cls.__dict__:
+            cls._default_label = False
+        elif cls._default_label:
+            cls.LABEL = sys.intern(cls.__name__.lower())
 
     @staticmethod
     def for_request(fed=None):
@@ -153,14 +240,10 @@ class Protocol:
           hostname domain is not a subdomain of ``brid.gy`` or isn't a known
           protocol
         """
-        domain = (util.domain_from_link(domain_or_url, minimize=False)
-                  if util.is_web(domain_or_url)
-                  else domain_or_url)
-
-        if domain == common.PRIMARY_DOMAIN or domain in common.LOCAL_DOMAINS:
+        label = _bridgy_subdomain_label(domain_or_url)
+        if label == 'fed':
             return PROTOCOLS[fed] if isinstance(fed, str) else fed
-        elif domain and domain.endswith(common.SUPERDOMAIN):
-            label = domain.removesuffix(common.SUPERDOMAIN)
+        elif label:
             return PROTOCOLS.get(label)
 
     @classmethod
@@ -263,8 +346,8 @@ class Protocol:
 
         return cls(id=id).key
 
-    @cached(LRUCache(20000), lock=Lock())
     @staticmethod
+    @functools.lru_cache(maxsize=20000)
     def for_id(id, remote=True):
         """Returns the protocol for a given id.
 
@@ -283,18 +366,16 @@ class Protocol:
 
         if util.is_web(id):
             # step 1: check for our per-protocol subdomains
-            is_homepage = urlparse(id).path.strip('/') == ''
             by_subdomain = Protocol.for_bridgy_subdomain(id)
-            if by_subdomain and not is_homepage and id not in BOT_ACTOR_AP_IDS:
+            if (by_subdomain and id not in BOT_ACTOR_AP_IDS
+                    and not _is_homepage(id)):
                 logger.info(f'  {by_subdomain.LABEL} owns id {id}')
                 return by_subdomain
 
         # step 2: check if any Protocols say conclusively that they own it
         # sort to be deterministic
-        protocols = sorted(set(p for p in PROTOCOLS.values() if p),
-                           key=lambda p: p.LABEL)
         candidates = []
-        for protocol in protocols:
+        for protocol in sorted_protocols():
             owns = protocol.owns_id(id)
             if owns:
                 logger.info(f'  {protocol.LABEL} owns id {id}')
@@ -360,10 +441,8 @@ class Protocol:
 
         # step 1: check if any Protocols say conclusively that they own it.
         # sort to be deterministic.
-        protocols = sorted(set(p for p in PROTOCOLS.values() if p),
-                           key=lambda p: p.LABEL)
         candidates = []
-        for proto in protocols:
+        for proto in sorted_protocols():
             owns = proto.owns_handle(handle)
             if owns:
                 logger.info(f'  {proto.LABEL} owns handle {handle}')
@@ -375,9 +454,12 @@ class Protocol:
             logger.info(f'  {candidates[0].LABEL} owns handle {handle}')
             return (candidates[0], None)
 
-        # step 2: look for matching User in the datastore
-        for proto in candidates:
-            user = proto.query(proto.handle == handle).get()
+        # step 2: look for matching User in the datastore. run the queries in
+        # parallel, but check results in candidate order to stay deterministic.
+        futures = [(proto, proto.query(proto.handle == handle).get_async())
+                   for proto in candidates]
+        for proto, future in futures:
+            user = future.get_result()
             if user:
                 if user.status:
                     return (None, None)
@@ -523,16 +605,16 @@ class Protocol:
             and obj.as1.get('objectType') in as1.ACTOR_TYPES
             and PROTOCOLS.get(obj.source_protocol) != cls
             and Protocol.for_bridgy_subdomain(id) not in DOMAINS
-            and 'Bridgy Fed]' not in html_to_text(obj.as1.get('summary', ''))
+            and not _has_bridged_disclaimer(obj.as1.get('summary'))
             # Web users are special cased, they don't get the label if they've
             # explicitly enabled Bridgy Fed with redirects or webmentions
             and not (from_user.LABEL == 'web'
                      and (from_user.last_webmention_in or from_user.has_redirects))):
-            obj.our_as1 = copy.deepcopy(obj.as1)
+            obj.our_as1 = json_copy(obj.as1)
             obj.our_as1['objectType'] = 'application'
 
             if from_user.key and id == from_user.profile_id():
-                disclaimer = f'[<a href="https://{PRIMARY_DOMAIN}{from_user.user_page_path()}">bridged</a> from <a href="{from_user.web_url()}">{from_user.handle_or_id()}</a> by <a href="https://{PRIMARY_DOMAIN}/">Bridgy Fed</a>]'
+                disclaimer = f'[<a href="https://{PRIMARY_DOMAIN}{from_user.user_page_path()}">bridged</a> from <a href="{from_user.web_url()}">{from_user.handle_or_id()}</a> {DISCLAIMER_HTML_SUFFIX}'
             else:
                 url = as1.get_url(obj.our_as1) or id
                 name = obj.our_as1.get('displayName') or obj.our_as1.get('username')
@@ -541,7 +623,7 @@ class Protocol:
                           else '')
                 if source:
                     source = ' from ' + source
-                disclaimer = f'[bridged{source} by <a href="https://{PRIMARY_DOMAIN}/">Bridgy Fed</a>]'
+                disclaimer = f'[bridged{source} {DISCLAIMER_HTML_SUFFIX}'
 
 
             summary = obj.our_as1.setdefault('summary', '')
@@ -609,10 +691,7 @@ class Protocol:
 
         Returns: bool:
         """
-        blocklist = DOMAIN_BLOCKLIST
-        if not allow_internal:
-            blocklist += DOMAINS
-        return util.domain_or_parent_in(util.domain_from_link(url), blocklist)
+        return _is_blocklisted(url, bool(allow_internal))
 
     @classmethod
     def translate_ids(to_cls, obj):
@@ -653,7 +732,7 @@ class Protocol:
         if not obj:
             return obj
 
-        outer_obj = copy.deepcopy(obj)
+        outer_obj = json_copy(obj)
         inner_obj = outer_obj['object'] = as1.get_object(outer_obj)
 
         def translate(elem, field, fn):
@@ -712,9 +791,16 @@ class Protocol:
         # check some invariants
         assert from_cls != Protocol
         assert isinstance(obj, Object), obj
-        logger.info(f'From {from_cls.LABEL}: {obj.key} AS1: {json_dumps(obj.as1, indent=2)}')
 
-        if not obj.as1:
+        # Object.as1 reconverts from obj's source data on every access unless
+        # our_as1 is set, in which case it's that same dict, not a copy. look it
+        # up once here and reuse it until normalize_ids and resolve_ids below
+        # modify obj
+        obj_as1 = obj.as1
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f'From {from_cls.LABEL}: {obj.key} AS1: {json_dumps(obj_as1, indent=2)}')
+
+        if not obj_as1:
             error('No object data provided')
 
         id = None
@@ -722,7 +808,7 @@ class Protocol:
             id = obj.key.id()
 
         if not id:
-            id = obj.as1.get('id')
+            id = obj_as1.get('id')
             obj.key = ndb.Key(Object, id)
 
         if not id:
@@ -733,7 +819,7 @@ class Protocol:
         # short circuit if we've already seen this activity id.
         # (don't do this for bare objects since we need to check further down
         # whether they've been updated since we saw them last.)
-        if obj.as1.get('objectType') == 'activity' and 'force' not in request.values:
+        if obj_as1.get('objectType') == 'activity' and 'force' not in request.values:
             with seen_ids_lock:
                 already_seen = id in seen_ids
                 seen_ids[id] = True
@@ -748,7 +834,7 @@ class Protocol:
 
         # load actor user, check authorization
         # https://www.w3.org/wiki/ActivityPub/Primer/Authentication_Authorization
-        actor = as1.get_owner(obj.as1)
+        actor = as1.get_owner(obj_as1)
         if not actor:
             error('Activity missing actor or author', status=400)
         elif from_cls.owns_id(actor) is False:
@@ -905,7 +991,7 @@ class Protocol:
                     return 'OK', 200
 
         # fetch actor if necessary
-        if actor and actor.keys() == set(['id']):
+        if actor and len(actor) == 1 and 'id' in actor:
             logger.info('Fetching actor so we have name, profile photo, etc')
             actor_obj = from_cls.load(actor['id'])
             if actor_obj and actor_obj.as1:
@@ -913,7 +999,7 @@ class Protocol:
 
         # fetch object if necessary so we can render it in feeds
         if (obj.type == 'share'
-                and inner_obj_as1.keys() == set(['id'])
+                and len(inner_obj_as1) == 1 and 'id' in inner_obj_as1
                 and from_cls.owns_id(inner_obj_id)):
             logger.info('Fetching object so we can render it in feeds')
             inner_obj = from_cls.load(inner_obj_id)
@@ -1158,7 +1244,8 @@ class Protocol:
                     **obj.as1,
                 },
             }
-            logger.info(f'Wrapping in update: {json_dumps(update_as1, indent=2)}')
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f'Wrapping in update: {json_dumps(update_as1, indent=2)}')
             return Object(id=id, our_as1=update_as1,
                           source_protocol=obj.source_protocol)
 
@@ -1179,7 +1266,8 @@ class Protocol:
                 'object': obj.as1,
                 'published': now,
             }
-            logger.info(f'Wrapping in post: {json_dumps(create_as1, indent=2)}')
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f'Wrapping in post: {json_dumps(create_as1, indent=2)}')
             return Object.get_or_create(create_id, our_as1=create_as1,
                                         source_protocol=obj.source_protocol,
                                         authed_as=authed_as)
@@ -1214,12 +1302,15 @@ class Protocol:
         logger.info(f'Delivering to: {obj.undelivered}')
 
         # enqueue send task for each targets
+        obj_key = obj.key.urlsafe()
         user = from_user.key.urlsafe()
-        for i, (target, orig_obj) in enumerate(sorted_targets):
-            orig_obj = orig_obj.key.urlsafe() if orig_obj else ''
-            common.create_task(queue='send', obj=obj.key.urlsafe(),
-                               url=target.uri, protocol=target.protocol,
-                               orig_obj=orig_obj, user=user)
+        common.create_tasks(queue='send', tasks=[{
+            'obj': obj_key,
+            'url': target.uri,
+            'protocol': target.protocol,
+            'orig_obj': orig_obj.key.urlsafe() if orig_obj else '',
+            'user': user,
+        } for target, orig_obj in sorted_targets])
 
         return 'OK', 202
 
@@ -1239,15 +1330,21 @@ class Protocol:
         """
         logger.info('Finding recipients and their targets')
 
-        target_uris = sorted(set(as1.targets(obj.as1)))
+        # Object.as1 reconverts from obj's source data on every access unless
+        # our_as1 is set, in which case it's that same dict, not a copy. obj's
+        # AS1 doesn't change in here, so only look it up once
+        obj_as1 = obj.as1
+        inner_obj_as1 = as1.get_object(obj_as1)
+
+        target_uris = sorted(set(as1.targets(obj_as1)))
         logger.info(f'Raw targets: {target_uris}')
         orig_obj = None
         targets = {}  # maps Target to Object or None
-        owner = as1.get_owner(obj.as1)
+        owner = as1.get_owner(obj_as1)
 
         in_reply_to_protocols = set()  # protocol kinds, eg 'MagicKey'
-        in_reply_to_owners = []
-        in_reply_tos = as1.get_ids(as1.get_object(obj.as1), 'inReplyTo')
+        in_reply_to_owners = set()
+        in_reply_tos = as1.get_ids(inner_obj_as1, 'inReplyTo')
         for in_reply_to in in_reply_tos:
             if proto := Protocol.for_id(in_reply_to):
                 if in_reply_to_obj := proto.load(in_reply_to):
@@ -1260,7 +1357,7 @@ class Protocol:
                                                      for c in in_reply_to_obj.copies)
 
                     if reply_owner := as1.get_owner(in_reply_to_obj.as1):
-                        in_reply_to_owners.append(reply_owner)
+                        in_reply_to_owners.add(reply_owner)
 
         is_reply = obj.type == 'comment' or in_reply_tos
         is_self_reply = False
@@ -1272,7 +1369,7 @@ class Protocol:
                 logger.info(f"  ...skipping, in-reply-to post(s) are same protocol and weren't bridged anywhere")
                 return {}
 
-        for id in sorted(target_uris):
+        for id in target_uris:
             protocol = Protocol.for_id(id)
             if not protocol:
                 logger.info(f"Can't determine protocol for {id}")
@@ -1282,13 +1379,14 @@ class Protocol:
                 continue
 
             orig_obj = protocol.load(id)
-            if not orig_obj or not orig_obj.as1:
+            orig_as1 = orig_obj.as1 if orig_obj else None
+            if not orig_as1:
                 logger.info(f"Couldn't load {id}")
                 continue
 
             # deliver self-replies to followers
             # https://github.com/snarfed/bridgy-fed/issues/639
-            if owner == as1.get_owner(orig_obj.as1):
+            if owner == as1.get_owner(orig_as1):
                 is_self_reply = True
                 logger.info(f'Looks like a self reply! Delivering to followers')
 
@@ -1323,8 +1421,10 @@ class Protocol:
         if (obj.type in ('post', 'update', 'delete', 'share')
                 and (not is_reply or (is_self_reply and in_reply_to_protocols))):
             logger.info(f'Delivering to followers of {user_key}')
+            # only need from_, so use a projection query
             followers = [f for f in Follower.query(Follower.to == user_key,
-                                                   Follower.status == 'active')
+                                                   Follower.status == 'active'
+                                                   ).iter(projection=[Follower.from_])
                          # skip protocol bot users
                          if not Protocol.for_bridgy_subdomain(f.from_.id())]
             user_keys = [f.from_ for f in followers]
@@ -1338,7 +1438,7 @@ class Protocol:
             if obj.type == 'share':
                 feed_obj = obj
             else:
-                inner = as1.get_object(obj.as1)
+                inner = inner_obj_as1
                 # don't add profile updates to feeds
                 if not (obj.type == 'update'
                         and inner.get('objectType') in as1.ACTOR_TYPES):
@@ -1401,11 +1501,10 @@ class Protocol:
         candidates = {t.uri: (t, obj) for t, obj in targets.items()}
         # maps Target to Object or None
         targets = {}
-        source_domains = [
+        source_domains = frozenset(
             util.domain_from_link(url) for url in
-            (obj.as1.get('id'), obj.as1.get('url'), as1.get_owner(obj.as1))
-            if util.is_web(url)
-        ]
+            (obj_as1.get('id'), obj_as1.get('url'), as1.get_owner(obj_as1))
+            if util.is_web(url))
         for url in sorted(util.dedupe_urls(
                 candidates.keys(),
                 # preserve our PDS URL without trailing slash in path
@@ -1487,7 +1586,7 @@ class Protocol:
             return None
 
         # https://stackoverflow.com/a/3042250/186123
-        size = len(_entity_to_protobuf(obj)._pb.SerializeToString())
+        size = _entity_to_protobuf(obj)._pb.ByteSize()
         if size > models.MAX_ENTITY_SIZE:
             logger.warning(f'Object is too big! {size} bytes is over {models.MAX_ENTITY_SIZE}')
             return None
@@ -1570,20 +1669,27 @@ def send_task():
 
     target = Target(uri=url, protocol=protocol)
 
-    obj = ndb.Key(urlsafe=form['obj']).get()
+    # load obj, user, and orig_obj in one batch
+    keys = [ndb.Key(urlsafe=form['obj'])]
+    user_key = form.get('user')
+    if user_key:
+        keys.append(ndb.Key(urlsafe=user_key))
+    if form.get('orig_obj'):
+        keys.append(ndb.Key(urlsafe=form['orig_obj']))
+
+    loaded = ndb.get_multi(keys)
+    obj = loaded[0]
+    user = loaded[1] if user_key else None
+    orig_obj = loaded[-1] if form.get('orig_obj') else None
+
     if (target not in obj.undelivered and target not in obj.failed
             and 'force' not in request.values):
         logger.info(f"{url} not in {obj.key.id()} undelivered or failed, giving up")
         return r'¯\_(ツ)_/¯', 204
 
-    user = None
-    if user_key := form.get('user'):
-        user = ndb.Key(urlsafe=user_key).get()
-    orig_obj = (ndb.Key(urlsafe=form['orig_obj']).get()
-                if form.get('orig_obj') else None)
-
     # send
-    logger.info(f'Sending {obj.key.id()} AS1: {json_dumps(obj.as1, indent=2)}')
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f'Sending {obj.key.id()} AS1: {json_dumps(obj.as1, indent=2)}')
     sent = None
     try:
         sent = PROTOCOLS[protocol].send(obj, url, from_user=user, orig_obj=orig_obj)
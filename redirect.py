@@ -14,8 +14,8 @@ Background:
 The conneg makes these ``/r/`` URLs searchable in Mastodon:
 https://github.com/snarfed/bridgy-fed/issues/352
 """
+import functools
 import logging
-import re
 import urllib.parse
 
 from flask import redirect, request
@@ -28,6 +28,7 @@ from oauth_dropins.webutil.util import json_dumps, json_loads
 from activitypub import ActivityPub
 from common import CACHE_CONTROL, CONTENT_TYPE_HTML
 from flask_app import app
+import models
 from protocol import Protocol
 from web import Web
 
@@ -48,6 +49,79 @@ HEADERS = {
     **CACHE_CONTROL,
 }
 
+# body for redirects. format with url (this URL) and to (the redirect target)
+REDIRECT_HTML = """\
+    <!doctype html>
+    <html>
+    <head>
+    <link href="{url}" rel="alternate" type="application/activity+json">
+    </head>
+    <title>Redirecting...</title>
+    <h1>Redirecting...</h1>
+    <p>You should be redirected automatically to the target URL: <a href="{to}">{to}</a>. If not, click the link.
+    </html>
+    """
+
+
+def _web_user(domain):
+    """Looks up the :class:`Web` user for a domain, caching misses.
+
+    Misses go in :attr:`models.users_not_found`, the same negative cache
+    :func:`pages.load_user` uses, which :meth:`models.User._post_put_hook`
+    invalidates. Hits aren't cached so that opt-outs and blocks take effect
+    immediately.
+
+    Args:
+      domain (str)
+
+    Returns:
+      web.Web: the user, or None if they don't exist or are opted out
+    """
+    with models.users_not_found_lock:
+        if (Web, domain) in models.users_not_found:
+            return None
+
+    if user := Web.get_by_id(domain):
+        return user
+
+    with models.users_not_found_lock:
+        models.users_not_found[(Web, domain)] = True
+    return None
+
+
+@functools.lru_cache(maxsize=8192)
+def _domain_from_link(url, minimize):
+    """Memoized :func:`oauth_dropins.webutil.util.domain_from_link`."""
+    return util.domain_from_link(url, minimize=minimize)
+
+
+@functools.lru_cache(maxsize=512)
+def _negotiate(accept):
+    """Runs content negotiation on an ``Accept`` header value. Memoized.
+
+    Clients send the same few ``Accept`` values over and over, so this caches
+    the negotiated result per raw header value.
+
+    Args:
+      accept (str): ``Accept`` header value
+
+    Returns:
+      (bool, str) tuple: whether AS2 was negotiated, and the negotiated
+      content type, or None
+    """
+    try:
+        negotiated = _negotiator.negotiate(accept)
+    except ValueError:
+        # work around https://github.com/CottageLabs/negotiator/issues/6
+        negotiated = None
+
+    if not negotiated:
+        return False, None
+
+    accept_type = str(negotiated.content_type)
+    return accept_type in (as2.CONTENT_TYPE, as2.CONTENT_TYPE_LD), accept_type
+
+
 @app.get(r'/r/<path:to>')
 @flask_util.headers(HEADERS)
 def redir(to):
@@ -61,7 +135,10 @@ def redir(to):
         to += '?' + urllib.parse.urlencode(request.args)
     # some browsers collapse repeated /s in the path down to a single slash.
     # if that happened to this URL, expand it back to two /s.
-    to = re.sub(r'^(https?:/)([^/])', r'\1/\2', to)
+    if to.startswith(('http:/', 'https:/')):
+        slash = 6 if to[4] == ':' else 7
+        if len(to) > slash and to[slash] != '/':
+            to = to[:slash] + '/' + to[slash:]
 
     if not util.is_web(to):
         error(f'Expected fully qualified URL; got {to}')
@@ -72,50 +149,32 @@ def redir(to):
         error(f'Invalid URL {to} : {e}')
 
     # check conneg
-    accept_as2 = False
     accept = request.headers.get('Accept')
-    if accept:
-        try:
-            negotiated = _negotiator.negotiate(accept)
-        except ValueError:
-            # work around https://github.com/CottageLabs/negotiator/issues/6
-            negotiated = None
-        if negotiated:
-            accept_type = str(negotiated.content_type)
-            if accept_type in (as2.CONTENT_TYPE, as2.CONTENT_TYPE_LD):
-                accept_as2 = True
+    accept_as2, accept_type = _negotiate(accept) if accept else (False, None)
 
     # check that we've seen this domain before so we're not an open redirect
-    domains = set((util.domain_from_link(to, minimize=True),
-                   util.domain_from_link(to, minimize=False),
-                   to_domain))
     web_user = None
-    for domain in domains:
-        if domain:
+    if to_domain not in DOMAIN_ALLOWLIST:
+        domains = []
+        for domain in (to_domain, _domain_from_link(to, minimize=True),
+                       _domain_from_link(to, minimize=False)):
+            if not domain or domain in domains:
+                continue
+            domains.append(domain)
             if domain in DOMAIN_ALLOWLIST:
                 break
-            if web_user := Web.get_by_id(domain):
+            if web_user := _web_user(domain):
                 logger.info(f'Found web user for domain {domain}')
                 break
-    else:
-        if not accept_as2:
-            return f'No web user found for any of {domains}', 404
+        else:
+            if not accept_as2:
+                return f'No web user found for any of {domains}', 404
 
     if not accept_as2:
         # redirect. include rel-alternate link to make posts discoverable by entering
         # https://fed.brid.gy/r/[URL] in a fediverse instance's search.
         logger.info(f'redirecting to {to}')
-        return f"""\
-    <!doctype html>
-    <html>
-    <head>
-    <link href="{request.url}" rel="alternate" type="application/activity+json">
-    </head>
-    <title>Redirecting...</title>
-    <h1>Redirecting...</h1>
-    <p>You should be redirected automatically to the target URL: <a href="{to}">{to}</a>. If not, click the link.
-    </html>
-    """, 301, {'Location': to}
+        return REDIRECT_HTML.format(url=request.url, to=to), 301, {'Location': to}
 
     # AS2 requested, fetch and convert and serve
     proto = Protocol.for_id(to)
@@ -1,4 +1,9 @@
 """Unit tests for common.py."""
+from concurrent.futures import Future
+from unittest.mock import patch
+
+from oauth_dropins.webutil.testutil import NOW
+
 # import first so that Fake is defined before URL routes are registered
 from .testutil import ExplicitEnableFake, Fake, OtherFake, TestCase
 
@@ -61,6 +66,45 @@ class CommonTest(TestCase):
         self.assertEqual('https://fed.brid.gy/',
                          common.subdomain_wrap(UIProtocol))
 
+    def test_unwrap_unchanged_returns_input(self):
+        obj = {
+            'id': 'http://foo',
+            'object': {'id': 'http://bar', 'tags': [{'url': 'http://baz'}]},
+        }
+        self.assertIs(obj, common.unwrap(obj))
+
+    def test_unwrap_copies_only_changed(self):
+        tags = [{'url': 'http://baz'}]
+        obj = {
+            'id': 'https://ap.brid.gy/r/http://foo',
+            'object': {'id': 'http://bar', 'tags': tags},
+        }
+        got = common.unwrap(obj)
+        self.assert_equals({
+            'id': 'http://foo',
+            'object': {'id': 'http://bar', 'tags': tags},
+        }, got)
+        self.assertEqual('https://ap.brid.gy/r/http://foo', obj['id'])
+        self.assertIs(obj['object'], got['object'])
+
+    def test_json_copy(self):
+        obj = {'id': 'http://foo', 'tags': [{'url': 'http://bar'}]}
+        got = common.json_copy(obj)
+        self.assertEqual(obj, got)
+        self.assertIsNot(obj['tags'], got['tags'])
+        self.assertIsNot(obj['tags'][0], got['tags'][0])
+
+        # not JSON serializable, falls back to deepcopy
+        obj = {'x': {1, 2}}
+        got = common.json_copy(obj)
+        self.assertEqual(obj, got)
+        self.assertIsNot(obj['x'], got['x'])
+
+        obj = {'published': NOW}
+        got = common.json_copy(obj)
+        self.assertEqual(obj, got)
+        self.assertIsNot(obj, got)
+
     def test_unwrap_protocol_subdomain(self):
         for input, expected in [
                 ('https://fa.brid.gy/ap/fake:foo', 'fake:foo'),
@@ -106,6 +150,43 @@ class CommonTest(TestCase):
         with app.test_request_context(base_url='https://bsky.brid.gy', path='/foo'):
             self.assertEqual('https://bsky.brid.gy/asdf', common.host_url('asdf'))
 
+    @patch('oauth_dropins.webutil.webmention.discover')
+    def test_webmention_discover_caches(self, mock_discover):
+        mock_discover.return_value = 'endpoint'
+
+        self.assertEqual('endpoint', common.webmention_discover('http://a.com/post'))
+        self.assertEqual('endpoint', common.webmention_discover('http://a.com/other'))
+        mock_discover.assert_called_once_with('http://a.com/post')
+
+        # home pages are cached separately
+        self.assertEqual('endpoint', common.webmention_discover('http://a.com/'))
+        self.assertEqual(2, mock_discover.call_count)
+        self.assertEqual({}, common._webmention_discover_inflight)
+
+    @patch('oauth_dropins.webutil.webmention.discover',
+           side_effect=ConnectionError('foo'))
+    def test_webmention_discover_fails(self, mock_discover):
+        with self.assertRaises(ConnectionError):
+            common.webmention_discover('http://a.com/post')
+        self.assertEqual({}, common._webmention_discover_inflight)
+
+        # failures aren't cached
+        with self.assertRaises(ConnectionError):
+            common.webmention_discover('http://a.com/post')
+        self.assertEqual(2, mock_discover.call_count)
+
+    @patch('oauth_dropins.webutil.webmention.discover')
+    def test_webmention_discover_waits_for_in_flight(self, mock_discover):
+        key = common.webmention_endpoint_cache_key('http://a.com/post')
+        future = common._webmention_discover_inflight[key] = Future()
+        self.addCleanup(common._webmention_discover_inflight.clear)
+
+        future.set_exception(ConnectionError('foo'))
+        with self.assertRaises(ConnectionError):
+            common.webmention_discover('http://a.com/post')
+
+        mock_discover.assert_not_called()
+
     def test_global_cache_policy(self):
         for good in (
             ATProto(id='alice'),
@@ -128,3 +209,13 @@ class CommonTest(TestCase):
             AtpBlock(id='abc123'),
         ):
             self.assertEqual(1800, common.global_cache_timeout_policy(bad.key._key))
+
+    @patch('oauth_dropins.webutil.appengine_config.tasks_client.create_task')
+    def test_create_tasks(self, mock_create_task):
+        common.RUN_TASKS_INLINE = False
+
+        got = common.create_tasks('send', [{'url': 'http://a'}, {'url': 'http://b'}])
+        self.assertEqual(2, len(got))
+        self.assertEqual(2, mock_create_task.call_count)
+        self.assert_task(mock_create_task, 'send', url='http://a')
+        self.assert_task(mock_create_task, 'send', url='http://b')
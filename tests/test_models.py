@@ -1,4 +1,5 @@
 """Unit tests for models.py."""
+import copy
 from datetime import timedelta
 from unittest import skip
 from unittest.mock import patch
@@ -964,6 +965,31 @@ class ObjectTest(TestCase):
             },
         }, obj.our_as1)
 
+    def test_resolve_ids_copies_doesnt_modify_input(self):
+        reply = {
+            'objectType': 'note',
+            'id': 'fake:reply',
+            'inReplyTo': 'fake:post',
+            'author': {'id': 'fake:alice', 'displayName': 'Alice'},
+            'tags': [{'objectType': 'mention', 'url': 'fake:alice'}],
+        }
+        orig = copy.deepcopy(reply)
+
+        self.make_user('other:alice', cls=OtherFake,
+                       copies=[Target(uri='fake:alice', protocol='fake')])
+        self.store_object(id='other:post',
+                          copies=[Target(uri='fake:post', protocol='fake')])
+
+        obj = Object(our_as1=reply, source_protocol='fake')
+        obj.resolve_ids()
+        self.assert_equals({
+            **reply,
+            'inReplyTo': 'other:post',
+            'author': {'id': 'other:alice', 'displayName': 'Alice'},
+            'tags': [{'objectType': 'mention', 'url': 'other:alice'}],
+        }, obj.our_as1)
+        self.assert_equals(orig, reply)
+
     def test_resolve_ids_multiple_in_reply_to(self):
         note = {
             'id': 'fake:note',
@@ -1,4 +1,5 @@
 """Unit tests for pages.py."""
+import copy
 from unittest import skip
 from unittest.mock import patch
 
@@ -21,7 +22,7 @@ import common
 from models import Object, Follower, Target
 from web import Web
 
-from granary.tests.test_bluesky import ACTOR_AS, ACTOR_PROFILE_BSKY
+from granary.tests.test_bluesky import ACTOR_AS
 from .test_web import ACTOR_AS2, REPOST_AS2
 
 ACTOR_WITH_PREFERRED_USERNAME = {
@@ -31,6 +32,12 @@ ACTOR_WITH_PREFERRED_USERNAME = {
     'image': 'http://pic',
 }
 
+FAKE_PROFILE = {
+    'objectType': 'person',
+    'id': 'fake:user',
+    'displayName': 'Ms User',
+}
+
 
 def contents(activities):
     return [
@@ -54,10 +61,26 @@ class PagesTest(TestCase):
         got = self.client.get('/web/user.com', base_url='https://fed.brid.gy/')
         self.assert_equals(200, got.status_code)
 
-    def test_user_fake(self):
+    def test_fake_pages(self):
         self.make_user('fake:foo', cls=Fake)
-        got = self.client.get('/fake/fake:foo')
-        self.assert_equals(200, got.status_code)
+
+        for page in '', '/home', '/notifications', '/followers', '/following', '/feed':
+            with self.subTest(page=page):
+                got = self.client.get(f'/fake/fake:foo{page}')
+                self.assert_equals(200, got.status_code)
+
+    def test_pages_user_not_found(self):
+        for page in '/followers', '/following', '/feed':
+            with self.subTest(page=page):
+                got = self.client.get(f'/web/nope.com{page}')
+                self.assert_equals(404, got.status_code)
+
+    def test_pages_web_redirect(self):
+        for page in '', '/followers', '/following', '/feed':
+            with self.subTest(page=page):
+                got = self.client.get(f'/user/user.com{page}')
+                self.assert_equals(301, got.status_code)
+                self.assert_equals(f'/web/user.com{page}', got.headers['Location'])
 
     def test_user_page_handle(self):
         user = self.make_user('http://fo/o', cls=ActivityPub,
@@ -101,6 +124,23 @@ class PagesTest(TestCase):
         got = self.client.get('/web/bar.com')
         self.assert_equals(404, got.status_code)
 
+    def test_user_not_found_then_created(self):
+        got = self.client.get('/web/bar.com')
+        self.assert_equals(404, got.status_code)
+
+        self.make_user('bar.com', cls=Web)
+        got = self.client.get('/web/bar.com')
+        self.assert_equals(200, got.status_code)
+
+    def test_user_handle_not_found_then_created(self):
+        got = self.client.get('/ap/@me@plus.google.com')
+        self.assert_equals(404, got.status_code)
+
+        self.make_user('http://fo/o', cls=ActivityPub,
+                       obj_as2=ACTOR_WITH_PREFERRED_USERNAME)
+        got = self.client.get('/ap/@me@plus.google.com')
+        self.assert_equals(200, got.status_code)
+
     def test_user_not_direct(self):
         got = self.client.get('/web/user.com')
         self.assert_equals(200, got.status_code)
@@ -115,11 +155,6 @@ class PagesTest(TestCase):
         got = self.client.get('/web/user.com')
         self.assert_equals(404, got.status_code)
 
-    def test_user_web_redirect(self):
-        got = self.client.get('/user/user.com')
-        self.assert_equals(301, got.status_code)
-        self.assert_equals('/web/user.com', got.headers['Location'])
-
     def test_user_use_instead(self):
         self.make_user('bar.com', cls=Web, use_instead=self.user.key)
 
@@ -173,12 +208,7 @@ class PagesTest(TestCase):
     def test_update_profile(self):
         self.make_user('fake:user', cls=Fake)
 
-        actor = {
-            'objectType': 'person',
-            'id': 'fake:user',
-            'displayName': 'Ms User',
-        }
-        Fake.fetchable = {'fake:profile:user': actor}
+        Fake.fetchable = {'fake:profile:user': copy.deepcopy(FAKE_PROFILE)}
         got = self.client.post('/fa/fake:user/update-profile')
         self.assert_equals(302, got.status_code)
         self.assert_equals('/fa/fake:handle:user', got.headers['Location'])
@@ -188,8 +218,10 @@ class PagesTest(TestCase):
 
         self.assertEqual(['fake:profile:user'], Fake.fetched)
 
-        actor['updated'] = '2022-01-02T03:04:05+00:00'
-        self.assert_object('fake:user', source_protocol='fake', our_as1=actor)
+        self.assert_object('fake:user', source_protocol='fake', our_as1={
+            **FAKE_PROFILE,
+            'updated': '2022-01-02T03:04:05+00:00',
+        })
 
     @patch.object(Fake, 'fetch', side_effect=ConnectionError('foo'))
     def test_update_profile_load_fails(self, _):
@@ -208,11 +240,7 @@ class PagesTest(TestCase):
 
         user = self.make_user('fake:user', cls=Fake)
 
-        Fake.fetchable = {'fake:profile:user': {
-            'objectType': 'person',
-            'id': 'fake:user',
-            'displayName': 'Ms User',
-        }}
+        Fake.fetchable = {'fake:profile:user': copy.deepcopy(FAKE_PROFILE)}
 
         # use handle in URL to check that we use key id as authed_as below
         got = self.client.post('/fa/fake:handle:user/update-profile')
@@ -245,21 +273,11 @@ class PagesTest(TestCase):
         self.assertIn('@follow@stored', body)
         self.assertIn('@me@plus.google.com', body)
 
-    def test_home_fake(self):
-        self.make_user('fake:foo', cls=Fake)
-        got = self.client.get('/fake/fake:foo/home')
-        self.assert_equals(200, got.status_code)
-
     def test_home_objects(self):
         self.add_objects()
         got = self.client.get('/web/user.com/home')
         self.assert_equals(200, got.status_code)
 
-    def test_notifications_fake(self):
-        self.make_user('fake:foo', cls=Fake)
-        got = self.client.get('/fake/fake:foo/notifications')
-        self.assert_equals(200, got.status_code)
-
     def test_notifications_objects(self):
         self.add_objects()
         got = self.client.get('/web/user.com/notifications')
@@ -288,11 +306,6 @@ class PagesTest(TestCase):
         self.assert_equals(self.EXPECTED_SNIPPETS,
                            contents(microformats2.html_to_activities(got.text)))
 
-    def test_followers_fake(self):
-        self.make_user('fake:foo', cls=Fake)
-        got = self.client.get('/fake/fake:foo/followers')
-        self.assert_equals(200, got.status_code)
-
     def test_followers_activitypub(self):
         obj = Object(id='https://inst/user', source_protocol='activitypub', as2={
             'id': 'https://inst/user',
@@ -310,15 +323,6 @@ class PagesTest(TestCase):
         self.assert_equals(200, got.status_code)
         self.assertNotIn('class="follower', got.get_data(as_text=True))
 
-    def test_followers_user_not_found(self):
-        got = self.client.get('/web/nope.com/followers')
-        self.assert_equals(404, got.status_code)
-
-    def test_followers_redirect(self):
-        got = self.client.get('/user/user.com/followers')
-        self.assert_equals(301, got.status_code)
-        self.assert_equals('/web/user.com/followers', got.headers['Location'])
-
     def test_following(self):
         Follower.get_or_create(
             from_=self.user,
@@ -344,20 +348,6 @@ class PagesTest(TestCase):
         self.assert_equals(200, got.status_code)
         self.assertNotIn('class="follower', got.get_data(as_text=True))
 
-    def test_following_fake(self):
-        self.make_user('fake:foo', cls=Fake)
-        got = self.client.get('/fake/fake:foo/following')
-        self.assert_equals(200, got.status_code)
-
-    def test_following_user_not_found(self):
-        got = self.client.get('/web/nope.com/following')
-        self.assert_equals(404, got.status_code)
-
-    def test_following_redirect(self):
-        got = self.client.get('/user/user.com/following')
-        self.assert_equals(301, got.status_code)
-        self.assert_equals('/web/user.com/following', got.headers['Location'])
-
     def test_following_before_empty(self):
         got = self.client.get(f'/web/user.com/following?before={util.now().isoformat()}')
         self.assert_equals(200, got.status_code)
@@ -366,20 +356,6 @@ class PagesTest(TestCase):
         got = self.client.get(f'/web/user.com/following?after={util.now().isoformat()}')
         self.assert_equals(200, got.status_code)
 
-    def test_feed_user_not_found(self):
-        got = self.client.get('/web/nope.com/feed')
-        self.assert_equals(404, got.status_code)
-
-    def test_feed_web_redirect(self):
-        got = self.client.get('/user/user.com/feed')
-        self.assert_equals(301, got.status_code)
-        self.assert_equals('/web/user.com/feed', got.headers['Location'])
-
-    def test_feed_fake(self):
-        self.make_user('fake:foo', cls=Fake)
-        got = self.client.get('/fake/fake:foo/feed')
-        self.assert_equals(200, got.status_code)
-
     def test_feed_html_empty(self):
         got = self.client.get('/web/user.com/feed')
         self.assert_equals(200, got.status_code)
@@ -1,6 +1,5 @@
 """Unit tests for redirect.py.
 """
-import copy
 from unittest.mock import patch
 
 from granary import as2
@@ -58,6 +57,31 @@ class RedirectTest(testutil.TestCase):
         self.assertEqual(404, got.status_code)
         self.assertEqual('Accept', got.headers['Vary'])
 
+    def test_redirect_caches_no_user(self):
+        got = self.client.get('/r/http://bar.com/baz')
+        self.assertEqual(404, got.status_code)
+
+        with patch.object(Web, 'get_by_id', side_effect=AssertionError):
+            got = self.client.get('/r/http://bar.com/baz')
+            self.assertEqual(404, got.status_code)
+
+    def test_redirect_user_opted_out_after_redirect(self):
+        got = self.client.get('/r/https://user.com/bar')
+        self.assertEqual(301, got.status_code)
+
+        self.user.manual_opt_out = True
+        self.user.put()
+        got = self.client.get('/r/https://user.com/bar')
+        self.assertEqual(404, got.status_code)
+
+    def test_redirect_html_no_user_then_user_created(self):
+        got = self.client.get('/r/http://bar.com/baz')
+        self.assertEqual(404, got.status_code)
+
+        self.make_user('bar.com', cls=Web)
+        got = self.client.get('/r/http://bar.com/baz')
+        self.assertEqual(301, got.status_code)
+
     def test_redirect_html_domain_allowlist(self):
         got = self.client.get('/r/http://bsky.app/baz')
         self.assertEqual(301, got.status_code)
@@ -121,10 +145,8 @@ class RedirectTest(testutil.TestCase):
         self.assertEqual(200, resp.status_code, resp.get_data(as_text=True))
         self.assertEqual('Accept', resp.headers['Vary'])
 
-        expected = copy.deepcopy(ACTOR_BASE_FULL)
-        del expected['endpoints']
-        del expected['followers']
-        del expected['following']
+        expected = {k: v for k, v in ACTOR_BASE_FULL.items()
+                    if k not in ('endpoints', 'followers', 'following')}
         self.assert_equals(expected, resp.json, ignore=['publicKey', 'summary'])
 
         self.assert_user(Web, 'user.com', direct=False, obj_as2={
@@ -225,9 +225,11 @@ class TestCase(unittest.TestCase, testutil.Asserts):
         common.RUN_TASKS_INLINE = True
         app.testing = True
         protocol.seen_ids.clear()
-        protocol.Protocol.for_id.cache.clear()
+        protocol.Protocol.for_id.cache_clear()
         common.webmention_discover.cache.clear()
         User.count_followers.cache.clear()
+        models.users_not_found.clear()
+        models.sorted_protocols.cache.clear()
         did.resolve_handle.cache.clear()
         did.resolve_plc.cache.clear()
         did.resolve_web.cache.clear()
@@ -2,7 +2,6 @@
 from datetime import timedelta, timezone
 import difflib
 import logging
-import re
 import statistics
 import urllib.parse
 from urllib.parse import quote, urlencode, urljoin, urlparse
@@ -26,7 +25,7 @@ from werkzeug.exceptions import BadGateway, BadRequest, HTTPException, NotFound
 import common
 from common import (
     CACHE_CONTROL,
-    DOMAIN_RE,
+    DOMAIN_PATTERN,
     PRIMARY_DOMAIN,
     PROTOCOL_DOMAINS,
     SUPERDOMAIN,
@@ -79,7 +78,7 @@ def is_valid_domain(domain, allow_internal=True):
 
     Valid means TLD is ok, not blacklisted, etc.
     """
-    if not domain or not re.match(DOMAIN_RE, domain):
+    if not domain or not DOMAIN_PATTERN.match(domain):
         # logger.debug(f"{domain} doesn't look like a domain")
         return False
 
@@ -429,7 +428,7 @@ class Web(User, Protocol):
     @classmethod
     def load(cls, id, **kwargs):
         """Wrap :meth:`Protocol.load` to convert domains to homepage URLs."""
-        if re.match(DOMAIN_RE, id):
+        if DOMAIN_PATTERN.match(id):
             id = f'https://{id}/'
 
         return super().load(id, **kwargs)
@@ -504,7 +503,8 @@ class Web(User, Protocol):
             entry.setdefault('type', ['h-card'])
         if parsed['url']:
             entry['url'] = parsed['url']
-        logger.info(f'Extracted microformats2 entry: {json_dumps(entry, indent=2)}')
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f'Extracted microformats2 entry: {json_dumps(entry, indent=2)}')
 
         if not is_homepage:
             # default actor/author to home page URL